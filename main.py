@@ -1,45 +1,131 @@
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Response, Query, Form, File, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict, Base64Bytes, ValidationError, field_validator
 from typing import Optional, List
 from datetime import datetime
+from contextlib import asynccontextmanager
+import json
 import os
+import uuid
+import boto3
 from sqlalchemy.engine import URL
+from fastapi_cache import FastAPICache
+from fastapi_cache.backends.redis import RedisBackend
+from fastapi_cache.decorator import cache
+from redis import asyncio as aioredis
+from cachetools import TTLCache
 
 from sqlalchemy import (
-    create_engine, Column, Integer, String, DateTime, Boolean,
-    Float, Text, ForeignKey
+    Column, Integer, String, DateTime, Boolean,
+    Float, Text, LargeBinary, ForeignKey, Index, select, insert, func, case, bindparam,
+    and_, or_
 )
-from sqlalchemy.orm import declarative_base, sessionmaker, Session, relationship
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.orm import declarative_base, relationship
 
 # ----------------- Config Banco -----------------
 
 DB_HOST = os.getenv("DB_HOST")
+DB_REPLICA_HOST = os.getenv("DB_REPLICA_HOST")  # sem réplica, lê do primário
 DB_NAME = os.getenv("DB_NAME")
 DB_USER = os.getenv("DB_USER")
 DB_PASS = os.getenv("DB_PASS")
 
-# Monta a URL de forma segura, sem quebrar quando a senha tem @, !, etc.
-db_url = URL.create(
-    drivername="mysql+pymysql",
-    username=DB_USER,
-    password=DB_PASS,
-    host=DB_HOST,
-    port=3306,
-    database=DB_NAME,
-)
 
-engine = create_engine(db_url, pool_pre_ping=True)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+def make_db_url(host: str) -> URL:
+    # Monta a URL de forma segura, sem quebrar quando a senha tem @, !, etc.
+    return URL.create(
+        drivername="mysql+aiomysql",
+        username=DB_USER,
+        password=DB_PASS,
+        host=host,
+        port=3306,
+        database=DB_NAME,
+    )
+
+
+# Pool dimensionado explicitamente, um por engine/host. Em cada MySQL (primário
+# e réplica), mantenha max_connections >= (pool_size + max_overflow) * workers
+# do uvicorn; sem DB_REPLICA_HOST só existe o pool do primário.
+# pool_recycle fica abaixo do wait_timeout do MySQL e pool_pre_ping cobre
+# conexões derrubadas por ociosidade; pool_use_lifo deixa as conexões
+# excedentes ficarem ociosas (e serem recicladas) quando o tráfego cai.
+def make_engine(host: str):
+    return create_async_engine(
+        make_db_url(host),
+        pool_pre_ping=True,
+        pool_size=25,
+        max_overflow=25,
+        pool_timeout=10,
+        pool_recycle=1800,
+        pool_use_lifo=True,
+        query_cache_size=1200,
+        # colunas com CURRENT_TIMESTAMP e os utcnow() do Python no mesmo relógio
+        connect_args={"init_command": "SET time_zone = '+00:00'"},
+    )
+
+
+# escritas (e leitura-seguida-de-escrita) no primário; GETs na réplica,
+# exceto o employees_list, que repovoa o cache do Redis
+write_engine = make_engine(DB_HOST)
+# sem réplica configurada, reaproveita o engine (e o pool) do primário
+read_engine = make_engine(DB_REPLICA_HOST) if DB_REPLICA_HOST else write_engine
+
+WriteSessionLocal = async_sessionmaker(
+    write_engine, class_=AsyncSession, expire_on_commit=False, autoflush=False
+)
+ReadSessionLocal = async_sessionmaker(
+    read_engine, class_=AsyncSession, expire_on_commit=False, autoflush=False
+)
 
 Base = declarative_base()
 
-def get_db() -> Session:
-    db = SessionLocal()
-    try:
+async def get_write_db() -> AsyncSession:
+    async with WriteSessionLocal() as db:
         yield db
-    finally:
-        db.close()
+
+async def get_read_db() -> AsyncSession:
+    async with ReadSessionLocal() as db:
+        yield db
+
+# ----------------- Config Reconhecimento -----------------
+
+# descritor facial = FACE_DESCRIPTOR_DIM float32 empacotados (little-endian)
+FACE_DESCRIPTOR_DIM = int(os.getenv("FACE_DESCRIPTOR_DIM", "128"))
+
+# ----------------- Config S3 (fotos) -----------------
+
+S3_BUCKET = os.getenv("S3_BUCKET")
+S3_REGION = os.getenv("S3_REGION", "us-east-1")
+S3_PUBLIC_URL = os.getenv("S3_PUBLIC_URL") or (
+    f"https://{S3_BUCKET}.s3.{S3_REGION}.amazonaws.com" if S3_BUCKET else None
+)
+PHOTO_CHUNK_SIZE = 5 * 1024 * 1024  # menor parte aceita pelo multipart do S3
+
+s3 = boto3.client("s3", region_name=S3_REGION)
+
+# ----------------- Config Cache -----------------
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+
+
+def cache_key_builder(func, namespace: str = "", *, request=None, response=None, args=(), kwargs=None):
+    # a sessão do banco muda a cada request; não pode entrar na chave.
+    # namespace já chega como "<prefix>:<namespace>", que é o que o
+    # FastAPICache.clear(namespace=...) apaga
+    kwargs = {k: v for k, v in (kwargs or {}).items() if k != "db"}
+    return f"{namespace}:{func.__module__}:{func.__name__}:{args}:{kwargs}"
+
+# ----------------- Config CORS -----------------
+
+# origens exatas (separadas por vírgula); "*" com credenciais o browser recusa
+CORS_ORIGINS = [
+    o.strip() for o in os.getenv("CORS_ORIGINS", "https://kiosk.example.com").split(",") if o.strip()
+]
 
 # ----------------- Models (espelho das tabelas) -----------------
 
@@ -53,10 +139,10 @@ class Employee(Base):
     department = Column(String(255))
     face_photo_url = Column(Text)
     face_photo_key = Column(Text)
-    face_descriptor = Column(Text)
+    face_descriptor = Column(LargeBinary)  # float32 empacotados, ver FACE_DESCRIPTOR_DIM
     is_active = Column(Boolean, default=True)
-    created_at = Column(DateTime)
-    updated_at = Column(DateTime)
+    created_at = Column(DateTime, server_default=func.now())
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
 
 
 class FridgeSession(Base):
@@ -65,14 +151,21 @@ class FridgeSession(Base):
     id = Column(Integer, primary_key=True, index=True)
     employee_id = Column(Integer, ForeignKey("employees.id"), nullable=False)
     device_id = Column(String(255), nullable=False)
-    opened_at = Column(DateTime)
+    opened_at = Column(DateTime, server_default=func.now())
     closed_at = Column(DateTime, nullable=True)
     capture_before_id = Column(Integer, nullable=True)
     capture_after_id = Column(Integer, nullable=True)
     status = Column(String(50), default="open")
     notes = Column(Text)
 
-    employee = relationship("Employee")
+    # sem lazy load implícito (no async ele nem funciona): quem precisar do
+    # colaborador carrega explicitamente com selectinload/joinedload
+    employee = relationship("Employee", lazy="raise")
+
+    # atende o filtro por colaborador + ORDER BY opened_at DESC do sessions_list
+    __table_args__ = (
+        Index("ix_fs_employee_opened", employee_id, opened_at.desc()),
+    )
 
 
 class RecognitionLog(Base):
@@ -84,17 +177,22 @@ class RecognitionLog(Base):
     confidence = Column(Float)
     success = Column(Boolean)
     error_message = Column(Text, nullable=True)
-    timestamp = Column(DateTime)
+    timestamp = Column(DateTime, server_default=func.now())
 
 
 class VisionItem(Base):
     __tablename__ = "vision_items"
 
     id = Column(Integer, primary_key=True, index=True)
-    capture_id = Column(Integer, index=True)
+    capture_id = Column(Integer)
     label = Column(String(255))
     quantity = Column(Integer)
 
+    # índice de cobertura: o diff do session_close sai só do índice
+    __table_args__ = (
+        Index("ix_vi_capture_label", "capture_id", "label", "quantity"),
+    )
+
 
 class ConsumptionEvent(Base):
     __tablename__ = "consumption_events"
@@ -107,6 +205,16 @@ class ConsumptionEvent(Base):
     created_at = Column(DateTime)
 
 
+# ----------------- Queries quentes (montadas uma vez) -----------------
+
+_SEL_EMP_BY_CODE = select(Employee).where(Employee.employee_code == bindparam("code"))
+_SEL_EMP_ID_BY_CODE = select(Employee.id).where(Employee.employee_code == bindparam("code"))
+_SEL_DESCRIPTOR_BY_CODE = select(Employee.face_descriptor).where(
+    Employee.employee_code == bindparam("code")
+)
+_SEL_SESSION_BY_ID = select(FridgeSession).where(FridgeSession.id == bindparam("session_id"))
+
+
 # ----------------- Schemas (Pydantic) -----------------
 
 class EmployeeCreate(BaseModel):
@@ -114,8 +222,22 @@ class EmployeeCreate(BaseModel):
     name: str
     email: Optional[str] = None
     department: Optional[str] = None
-    face_photo_base64: str
-    face_descriptor: str
+    face_descriptor_b64: Base64Bytes
+
+    @field_validator("face_descriptor_b64")
+    @classmethod
+    def check_descriptor_size(cls, v: bytes) -> bytes:
+        if len(v) != FACE_DESCRIPTOR_DIM * 4:
+            raise ValueError(
+                f"face_descriptor deve ter {FACE_DESCRIPTOR_DIM} float32 ({FACE_DESCRIPTOR_DIM * 4} bytes)"
+            )
+        return v
+
+
+class EmployeeCreateOut(BaseModel):
+    success: bool
+    employee_id: int
+    photo_url: Optional[str]
 
 
 class EmployeeOut(BaseModel):
@@ -125,10 +247,13 @@ class EmployeeOut(BaseModel):
     email: Optional[str]
     department: Optional[str]
     face_photo_url: Optional[str]
-    face_descriptor: Optional[str]
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
+
+
+class EmployeesListOut(BaseModel):
+    success: bool
+    employees: List[EmployeeOut]
 
 
 class RecognitionLogCreate(BaseModel):
@@ -139,6 +264,10 @@ class RecognitionLogCreate(BaseModel):
     error_message: Optional[str] = None
 
 
+class SuccessOut(BaseModel):
+    success: bool
+
+
 class SessionStartRequest(BaseModel):
     employee_code: str
     device_id: str
@@ -156,6 +285,17 @@ class SessionCloseRequest(BaseModel):
     capture_after_id: Optional[int] = None
 
 
+class ConsumedItem(BaseModel):
+    label: Optional[str]  # vision_items.label aceita NULL
+    quantity: int
+
+
+class SessionCloseOut(BaseModel):
+    success: bool
+    session_id: int
+    consumed: List[ConsumedItem]
+
+
 class SessionListItem(BaseModel):
     id: int
     employee_id: int
@@ -169,20 +309,31 @@ class SessionListItem(BaseModel):
     status: str
     notes: Optional[str]
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 # ----------------- FastAPI app -----------------
 
-app = FastAPI(title="IceVision Backend")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if not S3_BUCKET:
+        raise RuntimeError("S3_BUCKET não configurado")
+
+    redis = aioredis.from_url(REDIS_URL)
+    FastAPICache.init(RedisBackend(redis), prefix="icevision", key_builder=cache_key_builder)
+    yield
+    await redis.aclose()
+
+
+app = FastAPI(title="IceVision Backend", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],  # depois a gente fecha
+    allow_origins=CORS_ORIGINS,
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_methods=["GET", "POST"],
+    allow_headers=["Content-Type", "Authorization"],
+    max_age=86400,  # browser guarda o preflight por um dia
 )
 
 # ----------------- Helpers -----------------
@@ -191,20 +342,116 @@ def now():
     return datetime.utcnow()
 
 
+# employee_code -> employee_id, por processo. Só guarda códigos encontrados:
+# o id de um colaborador não muda, então não há o que invalidar entre workers.
+_emp_code_cache = TTLCache(maxsize=10000, ttl=300)
+
+
+async def resolve_employee_id(db: AsyncSession, code: str) -> Optional[int]:
+    if code in _emp_code_cache:
+        return _emp_code_cache[code]
+    emp_id = (await db.execute(_SEL_EMP_ID_BY_CODE, {"code": code})).scalar_one_or_none()
+    if emp_id is not None:
+        _emp_code_cache[code] = emp_id
+    return emp_id
+
+
+async def stream_sessions(q, limit: int):
+    # sessão própria: o gerador roda depois que o handler já retornou
+    async with ReadSessionLocal() as db:
+        result = await db.stream(q.execution_options(yield_per=500))
+        yield '{"success":true,"sessions":['
+        sep = ""
+        count = 0
+        last = None
+        async for row in result.mappings():
+            last = SessionListItem(**row)
+            yield sep + last.model_dump_json()
+            sep = ","
+            count += 1
+
+        # página cheia => pode haver mais; o cliente repassa os dois campos
+        # como query params na próxima chamada
+        next_cursor = None
+        if count == limit:
+            next_cursor = {
+                "before_opened_at": last.opened_at.isoformat() if last.opened_at else None,
+                "before_id": last.id,
+            }
+        yield '],"next_cursor":' + json.dumps(next_cursor) + "}"
+
+
+async def upload_photo(file: UploadFile, key: str):
+    # manda a foto em partes direto pro S3, sem segurar o arquivo inteiro em memória
+    # (boto3 é síncrono, então cada chamada vai pro threadpool)
+    mpu = await run_in_threadpool(
+        s3.create_multipart_upload,
+        Bucket=S3_BUCKET,
+        Key=key,
+        ContentType=file.content_type or "application/octet-stream",
+    )
+    upload_id = mpu["UploadId"]
+    parts = []
+    try:
+        while chunk := await file.read(PHOTO_CHUNK_SIZE):
+            part_number = len(parts) + 1
+            part = await run_in_threadpool(
+                s3.upload_part,
+                Bucket=S3_BUCKET,
+                Key=key,
+                UploadId=upload_id,
+                PartNumber=part_number,
+                Body=chunk,
+            )
+            parts.append({"ETag": part["ETag"], "PartNumber": part_number})
+
+        if not parts:
+            raise HTTPException(status_code=400, detail="Foto vazia")
+
+        await run_in_threadpool(
+            s3.complete_multipart_upload,
+            Bucket=S3_BUCKET,
+            Key=key,
+            UploadId=upload_id,
+            MultipartUpload={"Parts": parts},
+        )
+    except BaseException:
+        await run_in_threadpool(
+            s3.abort_multipart_upload, Bucket=S3_BUCKET, Key=key, UploadId=upload_id
+        )
+        raise
+
+
 # ----------------- Endpoints -----------------
 
 @app.post("/api/employee_create")
-def create_employee(payload: EmployeeCreate, db: Session = Depends(get_db)):
-    # checa código duplicado
-    existing = db.query(Employee).filter(
-        Employee.employee_code == payload.employee_code
-    ).first()
-    if existing:
-        raise HTTPException(status_code=409, detail="Código de colaborador já existe")
-
-    # TODO: salvar foto em disco ou S3 (por enquanto vamos só ignorar a base64)
-    photo_url = None
-    photo_key = None
+async def create_employee(
+    employee_code: str = Form(...),
+    name: str = Form(...),
+    email: Optional[str] = Form(None),
+    department: Optional[str] = Form(None),
+    face_descriptor_b64: str = Form(...),
+    face_photo: UploadFile = File(...),
+    db: AsyncSession = Depends(get_write_db),
+) -> EmployeeCreateOut:
+    # campos soltos no Form (um modelo de Form ao lado de um File vira um campo
+    # "payload" só); o EmployeeCreate continua validando o descritor
+    try:
+        payload = EmployeeCreate(
+            employee_code=employee_code,
+            name=name,
+            email=email,
+            department=department,
+            face_descriptor_b64=face_descriptor_b64,
+        )
+    except ValidationError as e:
+        raise RequestValidationError(
+            [{**err, "loc": ("body", *err["loc"])} for err in e.errors(include_context=False)]
+        )
+
+    photo_key = f"employees/{payload.employee_code}/{uuid.uuid4().hex}"
+    await upload_photo(face_photo, photo_key)
+    photo_url = f"{S3_PUBLIC_URL}/{photo_key}"
 
     emp = Employee(
         employee_code=payload.employee_code,
@@ -213,170 +460,211 @@ def create_employee(payload: EmployeeCreate, db: Session = Depends(get_db)):
         department=payload.department,
         face_photo_url=photo_url,
         face_photo_key=photo_key,
-        face_descriptor=payload.face_descriptor,
+        face_descriptor=payload.face_descriptor_b64,
         is_active=True,
-        created_at=now(),
-        updated_at=now(),
     )
     db.add(emp)
-    db.commit()
-    db.refresh(emp)
-
-    return {
-        "success": True,
-        "employee_id": emp.id,
-        "photo_url": emp.face_photo_url,
-    }
-
-
-@app.get("/api/employees_list", response_model=dict)
-def list_employees(db: Session = Depends(get_db)):
-    emps = db.query(Employee).order_by(Employee.name).all()
-    return {
-        "success": True,
-        "employees": [
-            EmployeeOut.from_orm(e) for e in emps
-        ],
-    }
+    try:
+        await db.commit()
+    except BaseException as e:
+        # a foto já subiu: qualquer falha no commit deixaria o objeto órfão
+        await db.rollback()
+        await run_in_threadpool(s3.delete_object, Bucket=S3_BUCKET, Key=photo_key)
+        if isinstance(e, IntegrityError):
+            # código duplicado: quem barra é o índice único de employee_code
+            raise HTTPException(status_code=409, detail="Código de colaborador já existe")
+        raise
+    await db.refresh(emp)
+    await FastAPICache.clear(namespace="employees")
+    _emp_code_cache.pop(payload.employee_code, None)
+
+    return EmployeeCreateOut(success=True, employee_id=emp.id, photo_url=emp.face_photo_url)
+
+
+@app.get("/api/employees_list")
+@cache(expire=60, namespace="employees")
+async def list_employees(db: AsyncSession = Depends(get_write_db)) -> EmployeesListOut:
+    # lê do primário: logo depois do clear no create_employee a réplica ainda
+    # pode estar atrasada, e o cache guardaria a lista velha por 60s
+    emps = (await db.execute(select(Employee).order_by(Employee.name))).scalars().all()
+    # o cache precisa de algo serializável, então valida os ORM uma vez aqui.
+    # No hit, o fastapi-cache2 devolve o dict cru do Redis (decode_as_type
+    # ignora o tipo); quem remonta o EmployeesListOut é a validação de
+    # resposta do FastAPI, pela anotação de retorno
+    return EmployeesListOut(success=True, employees=emps)
+
+
+@app.get("/api/employee_descriptor/{employee_code}")
+async def employee_descriptor(employee_code: str, db: AsyncSession = Depends(get_read_db)):
+    # bytes crus: no cliente, np.frombuffer(body, dtype=np.float32)
+    descriptor = (
+        await db.execute(_SEL_DESCRIPTOR_BY_CODE, {"code": employee_code})
+    ).scalar_one_or_none()
+    if descriptor is None:
+        raise HTTPException(status_code=404, detail="Descritor não encontrado")
+
+    return Response(content=descriptor, media_type="application/octet-stream")
 
 
 @app.post("/api/recognition_log")
-def recognition_log(payload: RecognitionLogCreate, db: Session = Depends(get_db)):
+async def recognition_log(
+    payload: RecognitionLogCreate, db: AsyncSession = Depends(get_write_db)
+) -> SuccessOut:
+    # código conhecido sai do cache em memória; inexistente vira NULL, como antes
     employee_id = None
     if payload.employee_code:
-        emp = (
-            db.query(Employee)
-            .filter(Employee.employee_code == payload.employee_code)
-            .first()
+        employee_id = await resolve_employee_id(db, payload.employee_code)
+
+    await db.execute(
+        insert(RecognitionLog).values(
+            employee_id=employee_id,
+            device_id=payload.device_id,
+            confidence=payload.confidence or 0.0,
+            success=payload.success,
+            error_message=payload.error_message,
         )
-        if emp:
-            employee_id = emp.id
-
-    log = RecognitionLog(
-        employee_id=employee_id,
-        device_id=payload.device_id,
-        confidence=payload.confidence or 0.0,
-        success=payload.success,
-        error_message=payload.error_message,
-        timestamp=now(),
     )
-    db.add(log)
-    db.commit()
-    return {"success": True}
+    await db.commit()
+    return SuccessOut(success=True)
 
 
 @app.post("/api/session_start", response_model=SessionStartResponse)
-def session_start(payload: SessionStartRequest, db: Session = Depends(get_db)):
+async def session_start(payload: SessionStartRequest, db: AsyncSession = Depends(get_write_db)):
     emp = (
-        db.query(Employee)
-        .filter(Employee.employee_code == payload.employee_code)
-        .first()
-    )
+        await db.execute(_SEL_EMP_BY_CODE, {"code": payload.employee_code})
+    ).scalar_one_or_none()
     if not emp:
         raise HTTPException(status_code=404, detail="Colaborador não encontrado")
 
     session = FridgeSession(
         employee_id=emp.id,
         device_id=payload.device_id,
-        opened_at=now(),
         status="open",
     )
     db.add(session)
-    db.commit()
-    db.refresh(session)
+    await db.commit()
+    await db.refresh(session)
 
     return SessionStartResponse(
         success=True,
         session_id=session.id,
-        employee=EmployeeOut.from_orm(emp),
+        employee=EmployeeOut.model_validate(emp),
     )
 
 
 @app.post("/api/session_close")
-def session_close(payload: SessionCloseRequest, db: Session = Depends(get_db)):
-    session = db.query(FridgeSession).filter(
-        FridgeSession.id == payload.session_id
-    ).first()
+async def session_close(
+    payload: SessionCloseRequest, db: AsyncSession = Depends(get_write_db)
+) -> SessionCloseOut:
+    # um só timestamp para o fechamento e para os eventos de consumo
+    ts = now()
+
+    session = (
+        await db.execute(_SEL_SESSION_BY_ID, {"session_id": payload.session_id})
+    ).scalar_one_or_none()
     if not session:
         raise HTTPException(status_code=404, detail="Sessão não encontrada")
 
-    session.closed_at = now()
+    session.closed_at = ts
     session.capture_before_id = payload.capture_before_id
     session.capture_after_id = payload.capture_after_id
     session.status = "closed"
-    db.add(session)
 
     consumed = []
+    events = []
     if payload.capture_before_id and payload.capture_after_id:
-        # monta dicionários label -> quantidade
-        before_items = {
-            i.label: i.quantity
-            for i in db.query(VisionItem)
-            .filter(VisionItem.capture_id == payload.capture_before_id)
-            .all()
-        }
-        after_items = {
-            i.label: i.quantity
-            for i in db.query(VisionItem)
-            .filter(VisionItem.capture_id == payload.capture_after_id)
-            .all()
-        }
-
-        for label, qty_before in before_items.items():
-            qty_after = after_items.get(label, 0)
-            delta = qty_before - qty_after
-            if delta > 0:
-                consumed.append({"label": label, "quantity": delta})
-                ev = ConsumptionEvent(
-                    session_id=session.id,
-                    employee_id=session.employee_id,
-                    product_label=label,
-                    quantity=delta,
-                    created_at=now(),
+        before_id = payload.capture_before_id
+        after_id = payload.capture_after_id
+        # soma por label as quantidades antes/depois numa única query; um
+        # round-trip só, melhor que disparar duas com asyncio.gather (que
+        # exigiria duas sessões/conexões, já que a AsyncSession serializa)
+        rows = (
+            await db.execute(
+                select(
+                    VisionItem.label,
+                    func.sum(
+                        case((VisionItem.capture_id == before_id, VisionItem.quantity), else_=0)
+                    ).label("b"),
+                    func.sum(
+                        case((VisionItem.capture_id == after_id, VisionItem.quantity), else_=0)
+                    ).label("a"),
                 )
-                db.add(ev)
-
-    db.commit()
-
-    return {
-        "success": True,
-        "session_id": session.id,
-        "consumed": consumed,
-    }
-
+                .where(VisionItem.capture_id.in_([before_id, after_id]))
+                .group_by(VisionItem.label)
+            )
+        ).all()
 
-@app.get("/api/sessions_list", response_model=dict)
-def sessions_list(employee_code: Optional[str] = None, db: Session = Depends(get_db)):
+        for label, qty_before, qty_after in rows:
+            delta = int(qty_before - qty_after)  # SUM volta como Decimal no MySQL
+            if delta > 0:
+                consumed.append(ConsumedItem(label=label, quantity=delta))
+                events.append({
+                    "session_id": session.id,
+                    "employee_id": session.employee_id,
+                    "product_label": label,
+                    "quantity": delta,
+                    "created_at": ts,
+                })
+
+    # um único INSERT multi-linha em vez de um por produto
+    if events:
+        await db.execute(insert(ConsumptionEvent), events)
+
+    await db.commit()
+
+    return SessionCloseOut(success=True, session_id=session.id, consumed=consumed)
+
+
+@app.get("/api/sessions_list")
+async def sessions_list(
+    employee_code: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=500),
+    before_opened_at: Optional[datetime] = None,
+    before_id: Optional[int] = None,
+):
+    # só as colunas do SessionListItem, sem instanciar objetos ORM
     q = (
-        db.query(
-            FridgeSession,
+        select(
+            FridgeSession.id,
+            FridgeSession.employee_id,
             Employee.employee_code,
             Employee.name.label("employee_name"),
+            FridgeSession.device_id,
+            FridgeSession.opened_at,
+            FridgeSession.closed_at,
+            FridgeSession.capture_before_id,
+            FridgeSession.capture_after_id,
+            FridgeSession.status,
+            FridgeSession.notes,
         )
         .join(Employee, FridgeSession.employee_id == Employee.id)
-        .order_by(FridgeSession.opened_at.desc())
+        # id desempata sessões abertas no mesmo segundo
+        .order_by(FridgeSession.opened_at.desc(), FridgeSession.id.desc())
     )
 
     if employee_code:
-        q = q.filter(Employee.employee_code == employee_code)
-
-    rows = q.all()
-    result: List[SessionListItem] = []
-    for s, code, emp_name in rows:
-        result.append(
-            SessionListItem(
-                id=s.id,
-                employee_id=s.employee_id,
-                employee_code=code,
-                employee_name=emp_name,
-                device_id=s.device_id,
-                opened_at=s.opened_at,
-                closed_at=s.closed_at,
-                capture_before_id=s.capture_before_id,
-                capture_after_id=s.capture_after_id,
-                status=s.status,
-                notes=s.notes,
+        q = q.where(Employee.employee_code == employee_code)
+
+    # paginação por keyset em (opened_at, id): sem OFFSET, o MySQL não varre
+    # as linhas puladas. No DESC os opened_at NULL vêm por último.
+    if before_id is not None:
+        if before_opened_at is None:
+            q = q.where(FridgeSession.opened_at.is_(None), FridgeSession.id < before_id)
+        else:
+            q = q.where(
+                or_(
+                    FridgeSession.opened_at < before_opened_at,
+                    and_(
+                        FridgeSession.opened_at == before_opened_at,
+                        FridgeSession.id < before_id,
+                    ),
+                    FridgeSession.opened_at.is_(None),
+                )
             )
-        )
+    elif before_opened_at:
+        q = q.where(FridgeSession.opened_at < before_opened_at)
+
+    q = q.limit(limit)
 
-    return {"success": True, "sessions": result}
+    # {"success", "sessions", "next_cursor"}, montado aos poucos
+    return StreamingResponse(stream_sessions(q, limit), media_type="application/json")
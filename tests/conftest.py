@@ -0,0 +1,101 @@
+import os
+import sys
+
+import pytest
+from fastapi.testclient import TestClient
+from fastapi_cache import FastAPICache
+from fastapi_cache.backends.inmemory import InMemoryBackend
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.pool import NullPool
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+
+
+class FakeS3:
+    """Guarda em memória o que o create_employee manda pro S3."""
+
+    def __init__(self):
+        self.objects = {}
+        self.pending = {}
+
+    def create_multipart_upload(self, Bucket, Key, ContentType):
+        self.pending[Key] = []
+        return {"UploadId": "upload-1"}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        self.pending[Key].append(Body)
+        return {"ETag": f"etag-{PartNumber}"}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        self.objects[Key] = b"".join(self.pending.pop(Key))
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.pending.pop(Key, None)
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop(Key, None)
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = tmp_path / "icevision.db"
+    sync_engine = create_engine(f"sqlite:///{path}")
+    main.Base.metadata.create_all(sync_engine)
+    yield path
+    sync_engine.dispose()
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    fake = FakeS3()
+    monkeypatch.setattr(main, "s3", fake)
+    monkeypatch.setattr(main, "S3_BUCKET", "test-bucket")
+    monkeypatch.setattr(main, "S3_PUBLIC_URL", "https://test-bucket.s3.local")
+    return fake
+
+
+@pytest.fixture
+def client(db_path, s3, monkeypatch):
+    # NullPool: cada request abre a conexão no event loop do TestClient
+    engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}", poolclass=NullPool)
+    SessionLocal = async_sessionmaker(
+        engine, class_=AsyncSession, expire_on_commit=False, autoflush=False
+    )
+
+    async def override_db():
+        async with SessionLocal() as db:
+            yield db
+
+    monkeypatch.setattr(main, "WriteSessionLocal", SessionLocal)
+    monkeypatch.setattr(main, "ReadSessionLocal", SessionLocal)
+    main.app.dependency_overrides[main.get_write_db] = override_db
+    main.app.dependency_overrides[main.get_read_db] = override_db
+    main._emp_code_cache.clear()
+    FastAPICache.init(InMemoryBackend(), prefix="test", key_builder=main.cache_key_builder)
+
+    # sem "with": o lifespan (Redis, checagem do S3) fica de fora
+    yield TestClient(main.app)
+
+    main.app.dependency_overrides.clear()
+
+
+@pytest.fixture
+def lagging_replica(client, tmp_path, monkeypatch):
+    """Réplica vazia, como se a replicação ainda não tivesse chegado."""
+    path = tmp_path / "replica.db"
+    main.Base.metadata.create_all(create_engine(f"sqlite:///{path}"))
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}", poolclass=NullPool)
+    SessionLocal = async_sessionmaker(
+        engine, class_=AsyncSession, expire_on_commit=False, autoflush=False
+    )
+
+    async def override_read_db():
+        async with SessionLocal() as db:
+            yield db
+
+    monkeypatch.setattr(main, "ReadSessionLocal", SessionLocal)
+    main.app.dependency_overrides[main.get_read_db] = override_read_db
+    return path
@@ -0,0 +1,180 @@
+import base64
+import struct
+from datetime import datetime
+
+import pytest
+from sqlalchemy import create_engine, null
+from sqlalchemy.orm import Session
+
+import main
+
+
+def descriptor_b64(dim=main.FACE_DESCRIPTOR_DIM):
+    return base64.b64encode(struct.pack(f"<{dim}f", *range(dim))).decode()
+
+
+def create_employee(client, code="E001", name="Ana", descriptor=None, photo=b"jpeg-bytes"):
+    return client.post(
+        "/api/employee_create",
+        data={
+            "employee_code": code,
+            "name": name,
+            "face_descriptor_b64": descriptor or descriptor_b64(),
+        },
+        files={"face_photo": ("face.jpg", photo, "image/jpeg")},
+    )
+
+
+def test_employee_create_multipart(client, s3):
+    resp = create_employee(client)
+
+    assert resp.status_code == 200, resp.text
+    body = resp.json()
+    assert body["success"] is True
+    [key] = s3.objects
+    assert s3.objects[key] == b"jpeg-bytes"
+    assert body["photo_url"] == f"https://test-bucket.s3.local/{key}"
+
+    descriptor = client.get("/api/employee_descriptor/E001")
+    assert descriptor.status_code == 200
+    assert descriptor.content == base64.b64decode(descriptor_b64())
+
+
+def test_employee_create_rejects_wrong_descriptor_size(client, s3):
+    resp = create_employee(client, descriptor=descriptor_b64(dim=3))
+
+    assert resp.status_code == 422
+    assert resp.json()["detail"][0]["loc"] == ["body", "face_descriptor_b64"]
+    assert s3.objects == {}
+
+
+def test_employee_create_duplicate_code_removes_photo(client, s3):
+    assert create_employee(client).status_code == 200
+
+    resp = create_employee(client, name="Outra")
+
+    assert resp.status_code == 409
+    assert len(s3.objects) == 1
+
+
+def test_employee_create_commit_failure_removes_photo(client, s3, monkeypatch):
+    async def broken_commit(self):
+        raise ConnectionResetError("conexão caiu")
+
+    monkeypatch.setattr(main.AsyncSession, "commit", broken_commit)
+
+    with pytest.raises(ConnectionResetError):
+        create_employee(client)
+
+    assert s3.objects == {}
+
+
+def add_sessions(db_path, opened_ats):
+    engine = create_engine(f"sqlite:///{db_path}")
+    with Session(engine) as db:
+        emp = main.Employee(employee_code="E001", name="Ana")
+        db.add(emp)
+        db.flush()
+        for opened_at in opened_ats:
+            db.add(main.FridgeSession(
+                employee_id=emp.id,
+                device_id="fridge-1",
+                # null() explícito, senão o server_default preenche
+                opened_at=null() if opened_at is None else opened_at,
+            ))
+        db.commit()
+    engine.dispose()
+
+
+def test_sessions_list_pages_through_ties_and_nulls(client, db_path):
+    t0 = datetime(2026, 1, 1, 12, 0, 0)
+    t1 = datetime(2026, 1, 1, 12, 0, 1)
+    add_sessions(db_path, [t0, t1, t1, t1, t1, None, None])
+
+    seen = []
+    params = {"limit": 2}
+    for _ in range(10):
+        body = client.get("/api/sessions_list", params=params).json()
+        seen += [s["id"] for s in body["sessions"]]
+        if body["next_cursor"] is None:
+            break
+        params = {"limit": 2, **{k: v for k, v in body["next_cursor"].items() if v is not None}}
+
+    # opened_at DESC, id DESC, NULLs por último
+    assert seen == [5, 4, 3, 2, 1, 7, 6]
+
+
+def test_session_start_and_close_reports_consumption(client, db_path):
+    assert create_employee(client).status_code == 200
+    engine = create_engine(f"sqlite:///{db_path}")
+    with Session(engine) as db:
+        db.add_all([
+            main.VisionItem(capture_id=1, label="coke", quantity=3),
+            main.VisionItem(capture_id=1, label="water", quantity=2),
+            main.VisionItem(capture_id=2, label="coke", quantity=1),
+            main.VisionItem(capture_id=2, label="water", quantity=2),
+        ])
+        db.commit()
+    engine.dispose()
+
+    start = client.post("/api/session_start", json={"employee_code": "E001", "device_id": "fridge-1"})
+    assert start.status_code == 200, start.text
+    session_id = start.json()["session_id"]
+
+    close = client.post(
+        "/api/session_close",
+        json={"session_id": session_id, "capture_before_id": 1, "capture_after_id": 2},
+    )
+
+    assert close.status_code == 200, close.text
+    assert close.json() == {
+        "success": True,
+        "session_id": session_id,
+        "consumed": [{"label": "coke", "quantity": 2}],
+    }
+
+
+def test_employees_list_sees_new_employee_after_create(client):
+    assert create_employee(client, code="E001", name="Ana").status_code == 200
+    first = client.get("/api/employees_list").json()
+    assert [e["employee_code"] for e in first["employees"]] == ["E001"]
+
+    assert create_employee(client, code="E002", name="Bruno").status_code == 200
+    second = client.get("/api/employees_list").json()
+
+    assert [e["employee_code"] for e in second["employees"]] == ["E001", "E002"]
+
+
+def test_employees_list_reads_primary_while_replica_lags(client, lagging_replica):
+    assert create_employee(client, code="E001", name="Ana").status_code == 200
+    client.get("/api/employees_list")
+    assert create_employee(client, code="E002", name="Bruno").status_code == 200
+
+    # o cache foi limpo e é repovoado do primário, não da réplica atrasada
+    listed = client.get("/api/employees_list").json()
+    assert [e["employee_code"] for e in listed["employees"]] == ["E001", "E002"]
+
+    # os outros GETs continuam na réplica
+    assert client.get("/api/employee_descriptor/E001").status_code == 404
+
+
+def test_session_close_with_null_label(client, db_path):
+    assert create_employee(client).status_code == 200
+    engine = create_engine(f"sqlite:///{db_path}")
+    with Session(engine) as db:
+        db.add_all([
+            main.VisionItem(capture_id=1, label=None, quantity=2),
+            main.VisionItem(capture_id=2, label=None, quantity=1),
+        ])
+        db.commit()
+    engine.dispose()
+    start = client.post("/api/session_start", json={"employee_code": "E001", "device_id": "fridge-1"})
+    session_id = start.json()["session_id"]
+
+    close = client.post(
+        "/api/session_close",
+        json={"session_id": session_id, "capture_before_id": 1, "capture_after_id": 2},
+    )
+
+    assert close.status_code == 200, close.text
+    assert close.json()["consumed"] == [{"label": None, "quantity": 1}]